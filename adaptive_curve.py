@@ -1,38 +1,73 @@
-import random
-from functools import lru_cache
-import matplotlib.pyplot as plt
 from solidity_math import MathLib
 
 
+_WAD = MathLib.WAD
+_2WAD = MathLib.TWO_WAD
+
+_LN_2_INT = 693147180559945309  # ln(2) * WAD
+_LN_2_HALF = _LN_2_INT // 2
+# Non-negative x below this bound reduces to q == 0 in _w_exp
+_W_EXP_Q0_BOUND = _LN_2_INT - _LN_2_HALF
+_LN_WEI_INT = -41446531673892822312  # ln(1e-18) * WAD
+# ln(type(int256).max / 1e36) * WAD
+_WEXP_UPPER_BOUND = 93859467695000404319
+# wExp(WEXP_UPPER_BOUND)
+_WEXP_UPPER_VALUE = 57716089161558943949701069502944508345128422502756744429568
+
+
 class AdaptiveCurveIrm:
-    WAD = 10**18
+    __slots__ = ('_COEFF_NEG', '_COEFF_POS', '_ERR_NORM_FACTOR_STEP',
+                 'rate_at_target', 'last_update', '_last_util_key', '_last_util_val',
+                 'memoized_rates')
+
+    WAD = _WAD
     SECONDS_PER_YEAR = 365 * 24 * 60 * 60
 
+    # Constants (converted to %/year). Subclass to simulate other parameters.
+    CURVE_STEEPNESS = 4 * WAD
+    ADJUSTMENT_SPEED = 50 * WAD // SECONDS_PER_YEAR
+    TARGET_UTILIZATION = 9 * WAD // 10
+    INITIAL_RATE_AT_TARGET = 4 * WAD // 100 // SECONDS_PER_YEAR
+    MIN_RATE_AT_TARGET = WAD // 1000 // SECONDS_PER_YEAR
+    MAX_RATE_AT_TARGET = 2 * WAD // SECONDS_PER_YEAR
+
     def __init__(self):
-        # Constants (converted to %/year)
-        self.CURVE_STEEPNESS = 4 * self.WAD
-        self.ADJUSTMENT_SPEED = 50 * self.WAD // self.SECONDS_PER_YEAR
-        self.TARGET_UTILIZATION = 9 * self.WAD // 10
-        self.INITIAL_RATE_AT_TARGET = 4 * self.WAD // 100 // self.SECONDS_PER_YEAR
-        self.MIN_RATE_AT_TARGET = self.WAD // 1000 // self.SECONDS_PER_YEAR
-        self.MAX_RATE_AT_TARGET = 2 * self.WAD // self.SECONDS_PER_YEAR
+        # Curve coefficients below and above the target utilization
+        self._COEFF_NEG = _WAD - \
+            MathLib.w_div_to_zero(_WAD, self.CURVE_STEEPNESS)
+        self._COEFF_POS = self.CURVE_STEEPNESS - _WAD
+        # Error normalization factor above target minus the one below target
+        self._ERR_NORM_FACTOR_STEP = _WAD - 2 * self.TARGET_UTILIZATION
 
         # State variables
         self.rate_at_target = 0
         self.last_update = 0
 
+        # Last (borrow, supply) pair and its (utilization, err, speed)
+        self._last_util_key = (-1, -1)
+        self._last_util_val = (0, 0, 0)
+
         # Memoization list for borrow rates and current time
         self.memoized_rates = []
 
-    @lru_cache(maxsize=1000)
     def borrow_rate(self, total_borrow_assets: int, total_supply_assets: int, current_time: int) -> int:
-        utilization = MathLib.w_div_down(
-            total_borrow_assets, total_supply_assets) if total_supply_assets > 0 else 0
+        util_key = (total_borrow_assets, total_supply_assets)
+        if util_key == self._last_util_key:
+            utilization, err, speed = self._last_util_val
+        else:
+            utilization = MathLib.w_div_down(
+                total_borrow_assets, total_supply_assets) if total_supply_assets > 0 else 0
+
+            target_utilization = self.TARGET_UTILIZATION
+            # WAD - TARGET_UTILIZATION above target, TARGET_UTILIZATION otherwise
+            err_norm_factor = (utilization > target_utilization) * \
+                self._ERR_NORM_FACTOR_STEP + target_utilization
+            err = MathLib.w_div_to_zero(
+                utilization - target_utilization, err_norm_factor)
+            speed = MathLib.w_mul_to_zero(self.ADJUSTMENT_SPEED, err)
 
-        err_norm_factor = (self.WAD -
-                           self.TARGET_UTILIZATION) if utilization > self.TARGET_UTILIZATION else self.TARGET_UTILIZATION
-        err = MathLib.w_div_to_zero(
-            utilization - self.TARGET_UTILIZATION, err_norm_factor)
+            self._last_util_key = util_key
+            self._last_util_val = (utilization, err, speed)
 
         start_rate_at_target = self.rate_at_target
 
@@ -40,7 +75,6 @@ class AdaptiveCurveIrm:
             avg_rate_at_target = self.INITIAL_RATE_AT_TARGET
             end_rate_at_target = self.INITIAL_RATE_AT_TARGET
         else:
-            speed = MathLib.w_mul_to_zero(self.ADJUSTMENT_SPEED, err)
             elapsed = (current_time - self.last_update)
             linear_adaptation = speed * elapsed
 
@@ -48,10 +82,16 @@ class AdaptiveCurveIrm:
                 avg_rate_at_target = start_rate_at_target
                 end_rate_at_target = start_rate_at_target
             else:
-                end_rate_at_target = self._new_rate_at_target(
-                    start_rate_at_target, linear_adaptation)
-                mid_rate_at_target = self._new_rate_at_target(
-                    start_rate_at_target, linear_adaptation // 2)
+                # _new_rate_at_target inlined for both end and mid rates
+                min_rate, max_rate = self.MIN_RATE_AT_TARGET, self.MAX_RATE_AT_TARGET
+                end_rate_at_target = (
+                    start_rate_at_target * self._w_exp(linear_adaptation)) // _WAD
+                end_rate_at_target = min_rate if end_rate_at_target < min_rate else (
+                    max_rate if end_rate_at_target > max_rate else end_rate_at_target)
+                mid_rate_at_target = (
+                    start_rate_at_target * self._w_exp(linear_adaptation // 2)) // _WAD
+                mid_rate_at_target = min_rate if mid_rate_at_target < min_rate else (
+                    max_rate if mid_rate_at_target > max_rate else mid_rate_at_target)
                 avg_rate_at_target = (
                     start_rate_at_target + end_rate_at_target + 2 * mid_rate_at_target) // 4
 
@@ -65,34 +105,42 @@ class AdaptiveCurveIrm:
 
         return rate
 
+    def batch_replay(self, borrows, supplies, times) -> list:
+        """Replays a known sequence of market states through borrow_rate and returns the rates."""
+        if not len(borrows) == len(supplies) == len(times):
+            raise ValueError("borrows, supplies and times must have the same length")
+        borrow_rate = self.borrow_rate
+        return [borrow_rate(int(b), int(s), int(t)) for b, s, t in zip(borrows, supplies, times)]
+
     def _curve(self, rate_at_target: int, err: int) -> int:
-        coeff = self.WAD - MathLib.w_div_to_zero(
-            self.WAD, self.CURVE_STEEPNESS) if err < 0 else self.CURVE_STEEPNESS - self.WAD
-        return MathLib.w_mul_to_zero(MathLib.w_mul_to_zero(coeff, err) + self.WAD, rate_at_target)
+        coeff = self._COEFF_NEG if err < 0 else self._COEFF_POS
+        return MathLib.w_mul_to_zero(MathLib.w_mul_to_zero(coeff, err) + _WAD, rate_at_target)
 
     def _new_rate_at_target(self, start_rate_at_target: int, linear_adaptation: int) -> int:
         new_rate = MathLib.w_mul_to_zero(
             start_rate_at_target, self._w_exp(linear_adaptation))
-        return max(min(new_rate, self.MAX_RATE_AT_TARGET), self.MIN_RATE_AT_TARGET)
+        min_rate, max_rate = self.MIN_RATE_AT_TARGET, self.MAX_RATE_AT_TARGET
+        return min_rate if new_rate < min_rate else (
+            max_rate if new_rate > max_rate else new_rate)
 
     def _w_exp(self, x: int) -> int:
-        LN_2_INT = 693147180559945309  # ln(2) * WAD
-        LN_WEI_INT = -41446531673892822312  # ln(1e-18) * WAD
-        # ln(type(int256).max / 1e36) * WAD
-        WEXP_UPPER_BOUND = 93859467695000404319
-        # wExp(WEXP_UPPER_BOUND)
-        WEXP_UPPER_VALUE = 57716089161558943949701069502944508345128422502756744429568
-
-        if x < LN_WEI_INT:
+        # q == 0: no range reduction or final shift needed
+        if 0 <= x < _W_EXP_Q0_BOUND:
+            return _WAD + x + (x * x) // _2WAD
+
+        if x < _LN_WEI_INT:
             return 0
-        if x >= WEXP_UPPER_BOUND:
-            return WEXP_UPPER_VALUE
+        if x >= _WEXP_UPPER_BOUND:
+            return _WEXP_UPPER_VALUE
 
-        rounding_adjustment = -LN_2_INT // 2 if x < 0 else LN_2_INT // 2
-        q = (x + rounding_adjustment) // LN_2_INT
-        r = x - q * LN_2_INT
+        # LN_2_INT // 2 for x >= 0 and the floored -LN_2_INT // 2 for x < 0, as in
+        # the original Python code. Solidity's wExp uses -(LN_2_INT / 2) and sdiv,
+        # both truncating, so negative x does not match the contract (see tests).
+        rounding_adjustment = _LN_2_HALF - (x < 0) * _LN_2_INT
+        q = (x + rounding_adjustment) // _LN_2_INT
+        r = x - q * _LN_2_INT
 
-        exp_r = self.WAD + r + (r * r) // self.WAD // 2
+        exp_r = _WAD + r + (r * r) // _2WAD
 
         if q >= 0:
             return exp_r << q
@@ -100,9 +148,11 @@ class AdaptiveCurveIrm:
             return exp_r >> (-q)
 
     def plot_rates(self):
+        import matplotlib.pyplot as plt
+
         times = [t for t, _ in self.memoized_rates]
         rates = [r * self.SECONDS_PER_YEAR * 100 /
-                 self.WAD for _, r in self.memoized_rates]
+                 _WAD for _, r in self.memoized_rates]
 
         plt.figure(figsize=(10, 6))
         plt.plot(times, rates)
@@ -114,30 +164,33 @@ class AdaptiveCurveIrm:
 
 
 if __name__ == "__main__":
+    import numpy as np
+
     irm = AdaptiveCurveIrm()
+    n_steps = 50
 
     # Set a seed for reproducibility
-    random.seed(42)
+    rng = np.random.default_rng(42)
+
+    # Generate debt and total_supply around the target utilization
+    total_supply = irm.WAD  # Set total_supply to WAD for simplicity
+    target_debt = total_supply * \
+        (irm.TARGET_UTILIZATION - irm.WAD // 10) // irm.WAD
 
-    # Current time in seconds
-    current_time = 0
-    for _ in range(50):
-        # Generate debt and total_supply around the target utilization
-        total_supply = irm.WAD  # Set total_supply to WAD for simplicity
-        target_debt = total_supply * \
-            (irm.TARGET_UTILIZATION - irm.WAD // 10) // irm.WAD
+    # Generate debt as a normal distribution around the target
+    std_dev = irm.WAD // 10  # 10% of WAD as standard deviation
+    debts = rng.normal(target_debt, std_dev, n_steps).astype(np.int64)
 
-        # Generate debt as a normal distribution around the target
-        std_dev = irm.WAD // 10  # 10% of WAD as standard deviation
-        debt = int(random.gauss(target_debt, std_dev))
+    # Ensure debt is within [0, total_supply] range
+    debts = np.clip(debts, 0, total_supply)
 
-        # Ensure debt is within [0, total_supply] range
-        debt = max(0, min(debt, total_supply))
+    # Current time in seconds, advanced randomly between 1 hour and 1 week
+    dts = rng.integers(3600, 604800, n_steps, endpoint=True)
+    times = np.concatenate(([0], np.cumsum(dts[:-1])))
 
+    for debt in debts.tolist():
         print(100*debt/total_supply)
-        # Calculate borrow rate
-        rate = irm.borrow_rate(debt, total_supply, current_time)
 
-        # Advance time randomly between 1 hour and 1 week
-        current_time += random.randint(3600, 604800)
+    # Calculate borrow rates
+    irm.batch_replay(debts, [total_supply] * n_steps, times)
     irm.plot_rates()
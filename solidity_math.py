@@ -1,7 +1,10 @@
 class MathLib:
     # Define WAD constant as 10^18
 
-    WAD = int(1e18)  # Since Python doesn't need separate int/uint types
+    WAD = 10**18
+    # Multiples of WAD used as divisors
+    TWO_WAD = 2 * WAD
+    THREE_WAD = 3 * WAD
 
     @staticmethod
     def w_mul_down(x: int, y: int) -> int:
@@ -35,10 +38,9 @@ class MathLib:
         to approximate a continuous compound interest rate.
         """
         first_term = x * n
-        second_term = MathLib.mul_div_down(
-            first_term, first_term, 2 * MathLib.WAD)
-        third_term = MathLib.mul_div_down(
-            second_term, first_term, 3 * MathLib.WAD)
+        # mul_div_down inlined: this runs once per accrual in simulations
+        second_term = (first_term * first_term) // MathLib.TWO_WAD
+        third_term = (second_term * first_term) // MathLib.THREE_WAD
         return first_term + second_term + third_term
 
     @staticmethod
@@ -1,6 +1,6 @@
 import pytest
 import math
-from adaptive_curve import AdaptiveCurveIrm
+from adaptive_curve import AdaptiveCurveIrm, _LN_2_HALF, _LN_WEI_INT, _W_EXP_Q0_BOUND, _WEXP_UPPER_BOUND
 from solidity_math import MathLib
 
 
@@ -116,3 +116,81 @@ def test_ge_min_rate_at_target(irm):
 def test_le_max_rate_at_target(irm):
     rate = irm.borrow_rate(9 * irm.WAD // 10, irm.WAD, 0)
     assert rate <= irm.MAX_RATE_AT_TARGET * irm.CURVE_STEEPNESS // irm.WAD
+
+
+def test_repeated_call_updates_state(irm):
+    irm.borrow_rate(irm.WAD, irm.WAD, 0)
+    irm.rate_at_target = 0
+    irm.borrow_rate(irm.WAD, irm.WAD, 0)
+    assert irm.rate_at_target == irm.INITIAL_RATE_AT_TARGET
+    assert [t for t, _ in irm.memoized_rates] == [0, 0]
+
+
+def test_requery_same_time(irm):
+    irm.borrow_rate(irm.TARGET_UTILIZATION, irm.WAD, 0)
+    first_rate = irm.borrow_rate(irm.WAD, irm.WAD, 24 * 60 * 60)
+    rate_at_target = irm.rate_at_target
+
+    rate = irm.borrow_rate(irm.WAD, irm.WAD, 24 * 60 * 60)
+    assert irm.rate_at_target == rate_at_target
+    assert rate == irm._curve(rate_at_target, irm.WAD)
+    assert rate > first_rate
+
+
+def test_batch_replay_matches_borrow_rate(irm):
+    borrows = [irm.TARGET_UTILIZATION, irm.WAD, 0, irm.WAD // 2]
+    supplies = [irm.WAD] * 4
+    times = [0, 24 * 60 * 60, 2 * 24 * 60 * 60, 3 * 24 * 60 * 60]
+
+    expected_irm = AdaptiveCurveIrm()
+    expected = [expected_irm.borrow_rate(b, s, t)
+                for b, s, t in zip(borrows, supplies, times)]
+
+    assert irm.batch_replay(borrows, supplies, times) == expected
+    assert irm.rate_at_target == expected_irm.rate_at_target
+    assert irm.last_update == times[-1]
+
+
+def test_batch_replay_length_mismatch(irm):
+    with pytest.raises(ValueError):
+        irm.batch_replay([irm.WAD, irm.WAD], [irm.WAD], [0, 1])
+    assert irm.memoized_rates == []
+
+
+def test_over_utilized_rate_is_memoized(irm):
+    rate = irm.borrow_rate(10**40, irm.WAD, 0)
+    assert rate == 380517503699999999999967021816346
+    assert irm.memoized_rates == [(0, rate)]
+
+
+def test_subclass_parameters_are_used():
+    class GentlerCurveIrm(AdaptiveCurveIrm):
+        CURVE_STEEPNESS = 2 * AdaptiveCurveIrm.WAD
+        TARGET_UTILIZATION = 8 * AdaptiveCurveIrm.WAD // 10
+
+    irm = GentlerCurveIrm()
+    assert irm.borrow_rate(irm.WAD, irm.WAD, 0) == irm.INITIAL_RATE_AT_TARGET * 2
+    assert irm.borrow_rate(irm.WAD * 8 // 10, irm.WAD, 0) == irm.INITIAL_RATE_AT_TARGET
+
+
+@pytest.mark.parametrize("x, expected", [
+    (_W_EXP_Q0_BOUND - 1, 1406630217019747831),
+    (_W_EXP_Q0_BOUND, 1426966072919605046),
+    (_LN_WEI_INT, 0),
+    (_WEXP_UPPER_BOUND - 1,
+     57716089161558943862588783571184261698504523000224082296832),
+])
+def test__w_exp_range_reduction_boundaries(irm, x, expected):
+    assert irm._w_exp(x) == expected
+
+
+# Expected values are ExpLib.wExp's: sdiv truncates q toward zero, while
+# _w_exp floors it, so negative exponents still diverge from Solidity.
+@pytest.mark.xfail(strict=True, reason="_w_exp floors q where Solidity's sdiv truncates")
+@pytest.mark.parametrize("x, expected", [
+    (-1, 999999999999999999),
+    (-_LN_2_HALF, 713483036459802523),
+    (-_LN_2_HALF - 1, 703315108509873915),
+])
+def test__w_exp_negative_matches_solidity(irm, x, expected):
+    assert irm._w_exp(x) == expected